@@ -1,18 +1,23 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel
 import uvicorn
 from typing import List, Optional
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime
 import asyncio
+import base64
 import logging
+import os
+
+import anyio.to_thread
 
 # Import actual services
 from services.face_service import FaceService
 from services.voice_service import VoiceService
 from services.gesture_service import GestureService
-from supabase_client import log_auth_event
+from supabase_client import schedule_auth_log, auth_log_worker
 
 # Configure logging
 logging.basicConfig(
@@ -21,10 +26,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background workers alongside the app"""
+    # Raise the AnyIO threadpool limit (default 40 shared tokens) so CPU-bound
+    # preprocessing of many simultaneous requests can spread across cores
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 64
+    if face_service is not None:
+        face_service.start_writer()
+        if face_service.batcher is not None:
+            face_service.batcher.start()
+    voice_flush_task = None
+    if voice_service is not None:
+        voice_flush_task = asyncio.create_task(voice_service.autoflush())
+    auth_log_task = asyncio.create_task(auth_log_worker())
+    yield
+    auth_log_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await auth_log_task
+    if voice_flush_task is not None:
+        voice_flush_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await voice_flush_task
+    if face_service is not None:
+        if face_service.batcher is not None:
+            await face_service.batcher.stop()
+        await face_service.stop_writer()
+        face_service.snapshot()
+
 app = FastAPI(
     title="AuthentiX API",
     description="Multi-Modal Authentication Backend",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson serializes response dicts several times faster than the
+    # default json encoder and handles numpy scalars natively
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware for React frontend - must be added BEFORE other middleware
@@ -62,6 +99,30 @@ except Exception as e:
 
 gesture_service = GestureService()
 
+# Uploads are streamed in chunks and rejected early once they exceed this,
+# so slow clients can't pin megabytes of buffer per concurrent request
+MAX_UPLOAD_BYTES = 5 << 20
+
+async def _read_capped(upload: UploadFile, limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read an upload in chunks, rejecting bodies over the size cap"""
+    buf = bytearray()
+    while chunk := await upload.read(64 * 1024):
+        buf.extend(chunk)
+        if len(buf) > limit:
+            raise HTTPException(status_code=413, detail="Uploaded file too large")
+    return bytes(buf)
+
+def _decode_capped(payload_b64: str, limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Decode a base64 payload from a batch sub-request, enforcing the same
+    size cap as the multipart endpoints. The check runs on the encoded
+    length (base64 expands 4/3) so oversized payloads are rejected before
+    decoding buys them any memory.
+    """
+    if len(payload_b64) > (limit * 4) // 3 + 4:
+        raise HTTPException(status_code=413, detail="Uploaded file too large")
+    return base64.b64decode(payload_b64)
+
 # Pydantic models
 class GestureData(BaseModel):
     user_id: str
@@ -107,7 +168,7 @@ async def enroll_face(
         # Read all images
         image_bytes_list = []
         for img in images:
-            img_bytes = await img.read()
+            img_bytes = await _read_capped(img)
             image_bytes_list.append(img_bytes)
             logger.info(f"Received image: {img.filename}, size: {len(img_bytes)} bytes")
         
@@ -116,13 +177,15 @@ async def enroll_face(
         
         # Log to Supabase
         if result.get("success"):
-            log_auth_event(user_id, "face", "enrolled", 1.0)
+            schedule_auth_log(user_id, "face", "enrolled", 1.0)
             logger.info(f"Face enrollment successful for user {user_id}")
         else:
-            log_auth_event(user_id, "face", "enrollment_failed", 0.0)
+            schedule_auth_log(user_id, "face", "enrollment_failed", 0.0)
             logger.warning(f"Face enrollment failed for user {user_id}: {result.get('message')}")
         
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Face enrollment error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -138,20 +201,22 @@ async def verify_face(
             raise HTTPException(status_code=503, detail="Face service not available")
         
         logger.info(f"Verifying face for user {user_id}")
-        image_bytes = await image.read()
+        image_bytes = await _read_capped(image)
         logger.info(f"Received image: {image.filename}, size: {len(image_bytes)} bytes")
         
         result = await face_service.verify(user_id, image_bytes)
         
         # Log to Supabase
         if result.get("success") and result.get("match"):
-            log_auth_event(user_id, "face", "verified", result.get("confidence", 0.0))
+            schedule_auth_log(user_id, "face", "verified", result.get("confidence", 0.0))
             logger.info(f"Face verification successful for user {user_id}, confidence: {result.get('confidence', 0.0):.3f}")
         else:
-            log_auth_event(user_id, "face", "verification_failed", result.get("confidence", 0.0))
+            schedule_auth_log(user_id, "face", "verification_failed", result.get("confidence", 0.0))
             logger.warning(f"Face verification failed for user {user_id}")
         
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Face verification error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -167,16 +232,18 @@ async def enroll_voice(
         if voice_service is None:
             raise HTTPException(status_code=503, detail="Voice service not available")
         
-        audio_bytes = await audio.read()
+        audio_bytes = await _read_capped(audio)
         result = await voice_service.enroll(user_id, audio_bytes)
         
         # Log to Supabase
         if result.get("success"):
-            log_auth_event(user_id, "voice", "enrolled", 1.0)
+            schedule_auth_log(user_id, "voice", "enrolled", 1.0)
         else:
-            log_auth_event(user_id, "voice", "enrollment_failed", 0.0)
+            schedule_auth_log(user_id, "voice", "enrollment_failed", 0.0)
         
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Voice enrollment error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -191,16 +258,18 @@ async def verify_voice(
         if voice_service is None:
             raise HTTPException(status_code=503, detail="Voice service not available")
         
-        audio_bytes = await audio.read()
+        audio_bytes = await _read_capped(audio)
         result = await voice_service.verify(user_id, audio_bytes)
         
         # Log to Supabase
         if result.get("success") and result.get("match"):
-            log_auth_event(user_id, "voice", "verified", result.get("confidence", 0.0))
+            schedule_auth_log(user_id, "voice", "verified", result.get("confidence", 0.0))
         else:
-            log_auth_event(user_id, "voice", "verification_failed", result.get("confidence", 0.0))
+            schedule_auth_log(user_id, "voice", "verification_failed", result.get("confidence", 0.0))
         
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Voice verification error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -230,5 +299,102 @@ async def verify_gesture(gesture_data: GestureData):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Batch Authentication Endpoint
+class SubRequest(BaseModel):
+    id: str
+    endpoint: str  # e.g. "/face/verify"
+    body: dict
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest]
+
+async def _batch_face_enroll(body: dict) -> dict:
+    if face_service is None:
+        raise HTTPException(status_code=503, detail="Face service not available")
+    images = [_decode_capped(img) for img in body["images"]]
+    result = await face_service.enroll_multiple(body["user_id"], images)
+    status = "enrolled" if result.get("success") else "enrollment_failed"
+    schedule_auth_log(body["user_id"], "face", status, 1.0 if result.get("success") else 0.0)
+    return result
+
+async def _batch_face_verify(body: dict) -> dict:
+    if face_service is None:
+        raise HTTPException(status_code=503, detail="Face service not available")
+    result = await face_service.verify(body["user_id"], _decode_capped(body["image"]))
+    status = "verified" if result.get("success") and result.get("match") else "verification_failed"
+    schedule_auth_log(body["user_id"], "face", status, result.get("confidence", 0.0))
+    return result
+
+async def _batch_voice_enroll(body: dict) -> dict:
+    if voice_service is None:
+        raise HTTPException(status_code=503, detail="Voice service not available")
+    result = await voice_service.enroll(body["user_id"], _decode_capped(body["audio"]))
+    status = "enrolled" if result.get("success") else "enrollment_failed"
+    schedule_auth_log(body["user_id"], "voice", status, 1.0 if result.get("success") else 0.0)
+    return result
+
+async def _batch_voice_verify(body: dict) -> dict:
+    if voice_service is None:
+        raise HTTPException(status_code=503, detail="Voice service not available")
+    result = await voice_service.verify(body["user_id"], _decode_capped(body["audio"]))
+    status = "verified" if result.get("success") and result.get("match") else "verification_failed"
+    schedule_auth_log(body["user_id"], "voice", status, result.get("confidence", 0.0))
+    return result
+
+async def _batch_gesture_enroll(body: dict) -> dict:
+    return await gesture_service.enroll(body["user_id"], body["gesture_sequence"])
+
+async def _batch_gesture_verify(body: dict) -> dict:
+    return await gesture_service.verify(body["user_id"], body["gesture_sequence"])
+
+# In-process router map for batch sub-requests; face/voice payloads are
+# base64-encoded in the JSON body
+_BATCH_HANDLERS = {
+    "/face/enroll": _batch_face_enroll,
+    "/face/verify": _batch_face_verify,
+    "/voice/enroll": _batch_voice_enroll,
+    "/voice/verify": _batch_voice_verify,
+    "/gesture/enroll": _batch_gesture_enroll,
+    "/gesture/verify": _batch_gesture_verify,
+}
+
+async def _dispatch_sub(req: SubRequest) -> dict:
+    handler = _BATCH_HANDLERS.get(req.endpoint)
+    if handler is None:
+        return {"id": req.id, "status": 404, "body": {"message": f"Unknown endpoint: {req.endpoint}"}}
+    try:
+        return {"id": req.id, "status": 200, "body": await handler(req.body)}
+    except HTTPException as e:
+        return {"id": req.id, "status": e.status_code, "body": {"message": e.detail}}
+    except Exception as e:
+        logger.error(f"Batch sub-request {req.id} failed: {e}", exc_info=True)
+        return {"id": req.id, "status": 500, "body": {"message": str(e)}}
+
+@app.post("/auth/batch")
+async def auth_batch(batch: BatchRequest):
+    """
+    Execute several auth sub-requests concurrently in one HTTP round-trip.
+    Mobile flows that enroll or verify face+voice+gesture together save two
+    round-trips, and concurrent face sub-requests share batched inference.
+    """
+    responses = await asyncio.gather(*[_dispatch_sub(r) for r in batch.requests])
+    return {"responses": list(responses)}
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if os.environ.get("AUTHENTIX_DEV") == "1":
+        # Development: auto-reload (single process, stdlib event loop)
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # Production: uvloop + httptools, single worker by default. The
+        # FAISS indexes, labels and WAL live in process memory per worker,
+        # so with N workers an enrollment is only visible to the worker
+        # that handled it and snapshot writes race on the same files.
+        # WEB_CONCURRENCY > 1 is only safe once the stores are shared.
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            loop="uvloop",
+            http="httptools",
+            workers=int(os.environ.get("WEB_CONCURRENCY", 1)),
+        )
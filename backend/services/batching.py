@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    """
+    Coalesce concurrent embedding requests into single batched model calls.
+
+    Callers submit one preprocessed input at a time; the background loop
+    collects up to max_batch_size inputs (waiting at most max_delay seconds
+    for stragglers), stacks them with np.stack and runs the model once.
+    """
+    def __init__(self, infer_fn, max_batch_size: int = 16, max_delay: float = 0.05):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        """Start the background batching loop (requires a running event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Embedding batcher started (max_batch_size={self.max_batch_size}, max_delay={self.max_delay}s)")
+
+    async def stop(self):
+        """Cancel the background batching loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, item: np.ndarray) -> np.ndarray:
+        """Queue one input and wait for its row of the batched result"""
+        if self._task is None:
+            # Lazy start so the service also works outside the app lifespan
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item, future = await self._queue.get()
+            batch = [(item, future)]
+
+            # Wait briefly for more requests to fill the batch
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            inputs = np.stack([i for i, _ in batch])
+            try:
+                outputs = await run_in_threadpool(self.infer_fn, inputs)
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}")
+                for _, f in batch:
+                    if not f.done():
+                        f.set_exception(e)
+            else:
+                for (_, f), output in zip(batch, outputs):
+                    if not f.done():
+                        f.set_result(output)
@@ -0,0 +1,88 @@
+import pickle
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingStore:
+    """
+    Contiguous float32 embedding matrix backed by a memory-mapped file.
+
+    Rows are append-only and line up one-to-one with FAISS index ids, so
+    retraining or rebuilding an index is a single add() over a contiguous
+    buffer instead of a walk over a dict of small heap-allocated arrays.
+    The file grows by doubling; capacity is derived from the file size and
+    only the row count lives in a small sidecar pickle written on flush().
+    """
+    def __init__(self, db_path: Path, dimension: int, initial_capacity: int = 1024):
+        self.data_file = db_path / "embeddings.f32"
+        self.meta_file = db_path / "embeddings_meta.pkl"
+        self.dimension = dimension
+        self.row_bytes = 4 * dimension
+        self.count = 0
+
+        if self.meta_file.exists():
+            with open(self.meta_file, 'rb') as f:
+                meta = pickle.load(f)
+            if meta.get('dimension') == dimension:
+                self.count = meta.get('count', 0)
+            else:
+                logger.warning(
+                    f"Embedding store dimension changed "
+                    f"({meta.get('dimension')} -> {dimension}), starting empty"
+                )
+
+        if not self.data_file.exists() or self.data_file.stat().st_size < self.row_bytes:
+            with open(self.data_file, 'wb') as f:
+                f.truncate(initial_capacity * self.row_bytes)
+
+        self._mm = self._open()
+
+    def _capacity(self) -> int:
+        return self.data_file.stat().st_size // self.row_bytes
+
+    def _open(self) -> np.memmap:
+        return np.memmap(
+            self.data_file, dtype='float32', mode='r+',
+            shape=(self._capacity(), self.dimension)
+        )
+
+    def _grow(self, min_capacity: int):
+        """Double the backing file until it holds at least min_capacity rows"""
+        capacity = max(self._capacity(), 1)
+        while capacity < min_capacity:
+            capacity *= 2
+        self._mm.flush()
+        del self._mm
+        with open(self.data_file, 'r+b') as f:
+            f.truncate(capacity * self.row_bytes)
+        self._mm = self._open()
+
+    def append_batch(self, vectors: np.ndarray) -> int:
+        """Append rows and return the row index of the first one"""
+        vectors = np.asarray(vectors, dtype='float32').reshape(-1, self.dimension)
+        start = self.count
+        if start + len(vectors) > self._capacity():
+            self._grow(start + len(vectors))
+        self._mm[start:start + len(vectors)] = vectors
+        self.count = start + len(vectors)
+        return start
+
+    def append(self, vector: np.ndarray) -> int:
+        """Append a single row and return its row index"""
+        return self.append_batch(vector.reshape(1, -1))
+
+    def vectors(self) -> np.ndarray:
+        """Zero-copy view of all stored embeddings, shape (count, dimension)"""
+        return self._mm[:self.count]
+
+    def flush(self):
+        """Sync the mmap and persist the row count"""
+        self._mm.flush()
+        with open(self.meta_file, 'wb') as f:
+            pickle.dump(
+                {'count': self.count, 'dimension': self.dimension},
+                f, protocol=pickle.HIGHEST_PROTOCOL
+            )
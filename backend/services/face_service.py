@@ -1,17 +1,94 @@
+import asyncio
 import numpy as np
 import faiss
 import pickle
 import cv2
 from pathlib import Path
 from typing import Optional, Tuple, Dict
-import io
-from PIL import Image
 from keras_facenet import FaceNet
+from starlette.concurrency import run_in_threadpool
+from cachetools import LRUCache
+import aiofiles
+import hashlib
+import threading
 import os
 import logging
 
+from .batching import EmbeddingBatcher
+from .embedding_store import EmbeddingStore
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+if NUMBA_AVAILABLE:
+    # Module-level (not a closure) so the on-disk JIT cache stays valid
+    @njit(cache=True, parallel=True, fastmath=True, boundscheck=False)
+    def _hog_features(gray):
+        """
+        HOG descriptor for a 64x64 float32 grayscale face: 9 orientation
+        bins per 8x8 cell, 2x2-cell blocks with L2-Hys normalization
+        """
+        h, w = gray.shape
+        cell = 8
+        n_bins = 9
+        cells_y = h // cell
+        cells_x = w // cell
+        hist = np.zeros((cells_y, cells_x, n_bins), dtype=np.float32)
+
+        for cy in prange(cells_y):
+            for cx in range(cells_x):
+                for ii in range(cell):
+                    i = cy * cell + ii
+                    i0 = i - 1 if i > 0 else i
+                    i1 = i + 1 if i < h - 1 else i
+                    for jj in range(cell):
+                        j = cx * cell + jj
+                        j0 = j - 1 if j > 0 else j
+                        j1 = j + 1 if j < w - 1 else j
+                        dy = gray[i1, j] - gray[i0, j]
+                        dx = gray[i, j1] - gray[i, j0]
+                        mag = np.sqrt(dx * dx + dy * dy)
+                        ang = np.degrees(np.arctan2(dy, dx)) % 180.0
+                        b = int(ang * n_bins / 180.0)
+                        if b >= n_bins:
+                            b = n_bins - 1
+                        hist[cy, cx, b] += mag
+
+        blocks_y = cells_y - 1
+        blocks_x = cells_x - 1
+        block_len = 4 * n_bins
+        out = np.empty(blocks_y * blocks_x * block_len, dtype=np.float32)
+        for by in range(blocks_y):
+            for bx in range(blocks_x):
+                base = (by * blocks_x + bx) * block_len
+                norm = 0.0
+                k = 0
+                for oy in range(2):
+                    for ox in range(2):
+                        for b in range(n_bins):
+                            v = hist[by + oy, bx + ox, b]
+                            out[base + k] = v
+                            norm += v * v
+                            k += 1
+                # L2-Hys: normalize, clip at 0.2, renormalize
+                norm = np.sqrt(norm) + 1e-6
+                norm2 = 0.0
+                for k in range(block_len):
+                    v = out[base + k] / norm
+                    if v > 0.2:
+                        v = 0.2
+                    out[base + k] = v
+                    norm2 += v * v
+                norm2 = np.sqrt(norm2) + 1e-6
+                for k in range(block_len):
+                    out[base + k] /= norm2
+        return out
+
 class FaceService:
     def __init__(self):
         self.db_path = Path("data/face")
@@ -19,10 +96,20 @@ class FaceService:
         
         self.index_file = self.db_path / "faiss_index.bin"
         self.labels_file = self.db_path / "labels.pkl"
-        self.embeddings_file = self.db_path / "embeddings.pkl"
+        self.wal_file = self.db_path / "enroll.log"
+        self.snapshot_every = 64  # enrolls between full snapshots
         
         self.dimension = 512  # FaceNet embedding dimension
         self.threshold = 0.75  # Cosine similarity threshold (higher = stricter)
+        # Embeddings needed before switching to the int8 scalar-quantized index.
+        # Note: quantization introduces a small cosine drift - re-measure the
+        # threshold on a holdout set if it is ever retuned.
+        self.sq_train_size = 1000
+        # "hnsw" (default) upgrades to HNSW+SQ; "ivfpq" upgrades to IVFPQ
+        # product quantization (~32 B/vector), for very large corpora where
+        # even int8 HNSW burns too much memory. PQ hits are re-ranked against
+        # the exact float32 vectors in the store before thresholding.
+        self.index_kind = os.environ.get("AUTHENTIX_FACE_INDEX", "hnsw").lower()
         
         # Initialize FaceNet model
         try:
@@ -31,30 +118,175 @@ class FaceService:
         except Exception as e:
             logger.warning(f"FaceNet model not available, using fallback: {e}")
             self.facenet_model = None
-            # Use smaller dimension for fallback
+
+        # Optional precompiled ONNX FaceNet (see export_facenet_onnx.py):
+        # fused kernels, no per-op Python dispatch, optional int8 weights
+        self.onnx_session = None
+        self._onnx_input = None
+        onnx_path = os.environ.get("AUTHENTIX_FACENET_ONNX", str(self.db_path / "facenet.onnx"))
+        if os.path.exists(onnx_path):
+            try:
+                import onnxruntime as ort
+                sess_options = ort.SessionOptions()
+                sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                self.onnx_session = ort.InferenceSession(
+                    onnx_path, sess_options=sess_options, providers=["CPUExecutionProvider"]
+                )
+                self._onnx_input = self.onnx_session.get_inputs()[0].name
+                logger.info(f"FaceNet ONNX session loaded from {onnx_path}")
+            except Exception as e:
+                logger.warning(f"Failed to load ONNX FaceNet, using keras model: {e}")
+
+        if self.facenet_model is None and self.onnx_session is None:
+            # Use smaller dimension for the HOG fallback
             self.dimension = 128
-        
-        # Load face detector
+
+        # Load face detector: prefer YuNet (SIMD-optimized ONNX detector,
+        # ~10x faster than the Haar cascade and works on BGR directly) when
+        # its model file is available, fall back to the Haar cascade
+        self.face_detector = None
+        # YuNet is stateful (setInputSize + detect), so concurrent
+        # threadpool workers must take this lock around each detection
+        self._detector_lock = threading.Lock()
+        yunet_path = os.environ.get("AUTHENTIX_YUNET_MODEL", str(self.db_path / "yunet.onnx"))
+        if hasattr(cv2, 'FaceDetectorYN') and os.path.exists(yunet_path):
+            try:
+                self.face_detector = cv2.FaceDetectorYN.create(
+                    yunet_path, "", (0, 0), score_threshold=0.6
+                )
+                logger.info(f"YuNet face detector loaded from {yunet_path}")
+            except Exception as e:
+                logger.warning(f"Failed to load YuNet detector, using Haar cascade: {e}")
         cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         self.face_cascade = cv2.CascadeClassifier(cascade_path)
+
+        # Batch concurrent FaceNet calls into single model invocations
+        self.batcher = None
+        if self.facenet_model is not None or self.onnx_session is not None:
+            self.batcher = EmbeddingBatcher(self._embed_batch, max_batch_size=16, max_delay=0.05)
+
+        # Content-addressed embedding cache: re-uploads of the same image
+        # (retries, flaky networks) skip the whole detect+inference pipeline
+        self._emb_cache = LRUCache(maxsize=4096)
+        self._emb_cache_lock = threading.Lock()
         
         # Initialize or load FAISS index
         self.index = self._load_or_create_index()
         self.labels = self._load_labels()
-        self.embeddings = self._load_embeddings()
-        
+        # SoA embedding store: one contiguous mmap'd float32 matrix whose
+        # rows mirror the FAISS index ids
+        self.store = EmbeddingStore(self.db_path, self.dimension)
+        if self.store.count < self.index.ntotal:
+            # Migrate/catch up from the index (legacy pickle deployments)
+            missing = self.index.ntotal - self.store.count
+            self.store.append_batch(self.index.reconstruct_n(self.store.count, missing))
+        # Contiguous row->user_id array mirroring self.labels, so verify can
+        # mask search results without a Python loop
+        self.labels_arr = np.array(
+            [self.labels.get(i) for i in range(self.index.ntotal)], dtype=object
+        )
+        self._enrolls_since_snapshot = 0
+        self._replay_wal()
+
+        # All index/label/embedding mutations go through a single writer task
+        # so threadpool readers never observe half-applied enrollments and
+        # concurrent enrolls batch into one FAISS add()
+        self._write_q = None
+        self._writer_task = None
+        # The writer mutates the live index/labels_arr from a threadpool
+        # thread; searches take the same lock so FAISS never runs a search
+        # concurrent with add()/rebuild and every returned id has a
+        # labels_arr row
+        self._index_lock = threading.Lock()
+
+    def _new_index(self) -> faiss.Index:
+        """
+        Create a fresh HNSW index. Inner Product over normalized vectors gives
+        cosine similarity, and the graph search stays sub-linear in the number
+        of enrolled faces (vs the O(N*d) scan of a flat index)
+        """
+        index = faiss.IndexHNSWFlat(self.dimension, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 200
+        index.hnsw.efSearch = 64
+        return index
+
+    def _new_sq_index(self) -> faiss.Index:
+        """
+        Create an HNSW index over int8 scalar-quantized vectors. Quarters the
+        bytes streamed per candidate vs float32 at near-identical recall, but
+        requires training on a representative sample first
+        """
+        index = faiss.IndexHNSWSQ(
+            self.dimension, faiss.ScalarQuantizer.QT_8bit, 32,
+            faiss.METRIC_INNER_PRODUCT
+        )
+        index.hnsw.efConstruction = 200
+        index.hnsw.efSearch = 64
+        return index
+
+    def _new_ivfpq_index(self, n: int) -> faiss.Index:
+        """
+        Create an IVFPQ index sized for n vectors: 32 product-quantizer
+        subspaces x 8 bits compresses each embedding to ~32 bytes
+        """
+        nlist = max(16, min(1024, n // 40))
+        quantizer = faiss.IndexFlatIP(self.dimension)
+        index = faiss.IndexIVFPQ(
+            quantizer, self.dimension, nlist, 32, 8, faiss.METRIC_INNER_PRODUCT
+        )
+        index.nprobe = 16
+        return index
+
+    def _maybe_upgrade_index(self):
+        """
+        Once enough embeddings have accumulated, swap the flat HNSW index for
+        the quantized one (HNSW+SQ by default, IVFPQ when configured),
+        trained and rebuilt from the current vectors
+        """
+        if not isinstance(self.index, faiss.IndexHNSWFlat):
+            return
+        if self.index.ntotal < self.sq_train_size:
+            return
+
+        try:
+            # Train and rebuild from the exact float32 originals in the store
+            vectors = np.ascontiguousarray(self.store.vectors())
+            if self.index_kind == "ivfpq":
+                new_index = self._new_ivfpq_index(len(vectors))
+                kind = "IVFPQ product quantization"
+            else:
+                new_index = self._new_sq_index()
+                kind = "int8 scalar quantization"
+            new_index.train(vectors)
+            new_index.add(vectors)
+            self.index = new_index
+            logger.info(f"Upgraded face index to {kind} ({new_index.ntotal} vectors)")
+        except Exception as e:
+            logger.error(f"Index quantization upgrade failed, keeping flat index: {e}")
+
     def _load_or_create_index(self) -> faiss.Index:
         """Load existing FAISS index or create new one"""
         if self.index_file.exists():
             try:
                 index = faiss.read_index(str(self.index_file))
                 logger.info(f"Loaded FAISS index with {index.ntotal} faces")
-                return index
+                if isinstance(index, (faiss.IndexHNSWFlat, faiss.IndexHNSWSQ)):
+                    index.hnsw.efSearch = 64
+                    return index
+                if isinstance(index, faiss.IndexIVFPQ):
+                    index.nprobe = 16
+                    return index
+                # Migrate a legacy flat index: HNSW doesn't support removal,
+                # so rebuild from the stored vectors in one add() call
+                logger.info("Migrating legacy flat index to HNSW")
+                new_index = self._new_index()
+                if index.ntotal > 0:
+                    new_index.add(index.reconstruct_n(0, index.ntotal))
+                return new_index
             except Exception as e:
                 logger.error(f"Failed to load index: {e}")
-        
-        # Use Inner Product for cosine similarity (requires normalized vectors)
-        index = faiss.IndexFlatIP(self.dimension)
+
+        index = self._new_index()
         logger.info("Created new FAISS index")
         return index
     
@@ -65,62 +297,155 @@ class FaceService:
                 return pickle.load(f)
         return {}
     
-    def _load_embeddings(self) -> dict:
-        """Load stored embeddings"""
-        if self.embeddings_file.exists():
-            with open(self.embeddings_file, 'rb') as f:
-                return pickle.load(f)
-        return {}
-    
     def _save_index(self):
         """Save FAISS index to disk"""
         faiss.write_index(self.index, str(self.index_file))
-    
+
     def _save_labels(self):
         """Save labels to disk"""
         with open(self.labels_file, 'wb') as f:
-            pickle.dump(self.labels, f)
-    
-    def _save_embeddings(self):
-        """Save embeddings to disk"""
-        with open(self.embeddings_file, 'wb') as f:
-            pickle.dump(self.embeddings, f)
-    
-    def _extract_face_embedding(self, image_bytes: bytes) -> Optional[np.ndarray]:
+            pickle.dump(self.labels, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _apply_enroll_batch(self, entries: list) -> list:
+        """
+        Add a batch of (user_id, embedding) pairs to the index and in-memory
+        state with a single FAISS add(), returning the new index ids
+        """
+        batch = np.vstack([e.reshape(1, -1) for _, e in entries])
+        with self._index_lock:
+            start = self.index.ntotal
+            self.index.add(batch)
+            # The store must hold this batch before any upgrade: the upgrade
+            # rebuilds the index from store.vectors(), so appending afterwards
+            # would drop the rows being enrolled and desync ids
+            self.store.append_batch(batch)
+            self._maybe_upgrade_index()
+
+            index_ids = []
+            for offset, (user_id, embedding) in enumerate(entries):
+                index_id = start + offset
+                self.labels[index_id] = user_id
+                index_ids.append(index_id)
+            self.labels_arr = np.append(self.labels_arr, [u for u, _ in entries])
+        return index_ids
+
+    def _apply_enroll(self, user_id: str, embedding: np.ndarray) -> int:
+        """Add one embedding to the index and in-memory state, return its id"""
+        return self._apply_enroll_batch([(user_id, embedding)])[0]
+
+    def _replay_wal(self):
+        """Re-apply enrollments logged since the last full snapshot"""
+        if not self.wal_file.exists():
+            return
+        replayed = 0
+        with open(self.wal_file, 'rb') as f:
+            while True:
+                try:
+                    user_id, embedding = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as e:
+                    logger.error(f"Corrupt WAL record, stopping replay: {e}")
+                    break
+                self._apply_enroll(user_id, embedding)
+                replayed += 1
+        if replayed:
+            logger.info(f"Replayed {replayed} enrollment(s) from WAL")
+            self._enrolls_since_snapshot = replayed
+
+    async def _log_enrolls(self, entries: list):
+        """Append enrollment records to the WAL without blocking the loop"""
+        async with aiofiles.open(self.wal_file, 'ab') as f:
+            await f.write(b''.join(
+                pickle.dumps(e, protocol=pickle.HIGHEST_PROTOCOL)
+                for e in entries
+            ))
+
+    def snapshot(self):
+        """Write the full index/labels/embeddings state and truncate the WAL"""
+        self._save_index()
+        self._save_labels()
+        self.store.flush()
+        with open(self.wal_file, 'wb'):
+            pass
+        self._enrolls_since_snapshot = 0
+        logger.info(f"Snapshotted face database ({self.index.ntotal} embeddings)")
+
+    def start_writer(self):
+        """Start the single-writer task (requires a running event loop)"""
+        if self._writer_task is None:
+            self._write_q = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def stop_writer(self):
+        """Drain pending writes and cancel the writer task"""
+        if self._writer_task is not None:
+            await self._write_q.join()
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+
+    async def _writer_loop(self):
+        while True:
+            batch = [await self._write_q.get()]
+            while not self._write_q.empty() and len(batch) < 32:
+                batch.append(self._write_q.get_nowait())
+
+            entries = [(user_id, embedding) for user_id, embedding, _ in batch]
+            try:
+                index_ids = await run_in_threadpool(self._apply_enroll_batch, entries)
+                await self._log_enrolls(entries)
+                self._enrolls_since_snapshot += len(entries)
+                if self._enrolls_since_snapshot >= self.snapshot_every:
+                    await run_in_threadpool(self.snapshot)
+            except Exception as e:
+                logger.error(f"Enrollment write batch failed: {e}", exc_info=True)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, _, future), index_id in zip(batch, index_ids):
+                    if not future.done():
+                        future.set_result(index_id)
+            finally:
+                for _ in batch:
+                    self._write_q.task_done()
+
+    async def _commit_enroll(self, user_id: str, embedding: np.ndarray) -> int:
         """
-        Extract face embedding from image bytes using FaceNet
+        Persist one enrollment through the writer task: the WAL append stays
+        O(1) per enroll and concurrent enrolls share a single FAISS add()
+        """
+        if self._writer_task is None:
+            # Lazy start so the service also works outside the app lifespan
+            self.start_writer()
+        future = asyncio.get_running_loop().create_future()
+        await self._write_q.put((user_id, embedding, future))
+        return await future
+
+    def _preprocess_face(self, image_bytes: bytes) -> Optional[np.ndarray]:
+        """
+        Decode image bytes, detect the largest face and return it as a
+        160x160x3 RGB array ready for FaceNet
         """
         try:
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(image_bytes))
-            image_np = np.array(image)
-            
-            # Convert RGB to BGR for OpenCV
-            if len(image_np.shape) == 2:
-                # Grayscale to BGR
-                image_np = cv2.cvtColor(image_np, cv2.COLOR_GRAY2BGR)
-            elif len(image_np.shape) == 3 and image_np.shape[2] == 3:
-                image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
-            elif len(image_np.shape) == 3 and image_np.shape[2] == 4:
-                image_np = cv2.cvtColor(image_np, cv2.COLOR_RGBA2BGR)
-            
-            # Detect face using OpenCV Haar Cascade
-            gray = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(
-                gray, 
-                scaleFactor=1.1, 
-                minNeighbors=5,
-                minSize=(30, 30)
-            )
-            
-            if len(faces) == 0:
+            # Decode straight to BGR with OpenCV (libjpeg-turbo SIMD path);
+            # IMREAD_COLOR promotes grayscale and drops alpha, so no
+            # per-format conversion branches are needed
+            image_np = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if image_np is None:
+                logger.warning("Failed to decode image")
+                return None
+
+            face = self._detect_face(image_np)
+            if face is None:
                 logger.warning("No face detected in image")
                 return None
-            
-            # Get the largest face
-            largest_face = max(faces, key=lambda f: f[2] * f[3])
-            (x, y, w, h) = largest_face
-            
+            (x, y, w, h) = face
+
             # Add padding around face
             padding = int(0.2 * w)
             x = max(0, x - padding)
@@ -128,55 +453,147 @@ class FaceService:
             w = min(image_np.shape[1] - x, w + 2 * padding)
             h = min(image_np.shape[0] - y, h + 2 * padding)
             
-            face_roi = image_np[y:y+h, x:x+w]
-            
-            # Resize to FaceNet input size (160x160)
-            face_roi = cv2.resize(face_roi, (160, 160))
-            
-            # Convert BGR to RGB for FaceNet
-            face_rgb = cv2.cvtColor(face_roi, cv2.COLOR_BGR2RGB)
-            
-            # Generate embedding using FaceNet
-            if self.facenet_model is not None:
-                # FaceNet expects input shape (1, 160, 160, 3)
-                face_input = np.expand_dims(face_rgb, axis=0)
-                embedding = self.facenet_model.embeddings(face_input)[0]
+            # Resize the cropped ROI to the fixed 160x160 FaceNet input and
+            # swap BGR->RGB on the small image; the whole pipeline is now
+            # branch-free straight-line code for the one shape the model takes
+            return cv2.cvtColor(
+                cv2.resize(image_np[y:y+h, x:x+w], (160, 160)),
+                cv2.COLOR_BGR2RGB
+            )
+
+        except Exception as e:
+            logger.error(f"Error preprocessing face image: {e}")
+            return None
+
+    def _detect_face(self, image_np: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        """Detect the best face in a BGR image, returning (x, y, w, h)"""
+        if self.face_detector is not None:
+            # YuNet takes BGR directly - no grayscale pass needed. The
+            # detector is shared and stateful, so the input-size/detect
+            # pair must not interleave across threads
+            h, w = image_np.shape[:2]
+            with self._detector_lock:
+                self.face_detector.setInputSize((w, h))
+                _, faces = self.face_detector.detect(image_np)
+            if faces is None or len(faces) == 0:
+                return None
+            # Highest-confidence detection (score is the last column)
+            best = faces[np.argmax(faces[:, -1])]
+            x, y, fw, fh = best[:4].astype(int)
+            x, y = max(0, x), max(0, y)
+            return (x, y, min(fw, w - x), min(fh, h - y))
+
+        # Haar cascade fallback needs a grayscale pass
+        gray = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(
+            gray,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(30, 30)
+        )
+        if len(faces) == 0:
+            return None
+        # Get the largest face
+        largest_face = max(faces, key=lambda f: f[2] * f[3])
+        (x, y, w, h) = largest_face
+        return (x, y, w, h)
+
+    def _embed_batch(self, faces: np.ndarray) -> np.ndarray:
+        """Run FaceNet on a stacked batch of preprocessed (N, 160, 160, 3) faces"""
+        if self.onnx_session is not None:
+            # Same fixed standardization keras-facenet applies internally,
+            # done in place on the float copy to avoid two extra temporaries
+            batch = faces.astype(np.float32)
+            batch -= 127.5
+            batch *= 1.0 / 128.0
+            return self.onnx_session.run(None, {self._onnx_input: batch})[0]
+        return self.facenet_model.embeddings(faces)
+
+    def _fallback_embedding(self, face_rgb: np.ndarray) -> np.ndarray:
+        """
+        Histogram-based embedding used when FaceNet is not available.
+
+        This must stay a deterministic, lock-free function of the input
+        image: random placeholders would break verify (same face, new
+        embedding every call) and global-RNG calls serialize threadpool
+        workers on the RNG lock.
+        """
+        logger.info("Using fallback embedding method (no FaceNet)")
+        # Convert to grayscale for histogram
+        gray_face = cv2.cvtColor(face_rgb, cv2.COLOR_RGB2GRAY)
+        # Resize to consistent size
+        gray_face = cv2.resize(gray_face, (64, 64))
+        # Extract HOG features (Histogram of Oriented Gradients)
+        if NUMBA_AVAILABLE:
+            embedding = _hog_features(gray_face.astype(np.float32))
+        else:
+            from skimage.feature import hog
+            embedding = hog(
+                gray_face,
+                orientations=9,
+                pixels_per_cell=(8, 8),
+                cells_per_block=(2, 2),
+                visualize=False
+            )
+        # Ensure dimension matches
+        if len(embedding) > self.dimension:
+            embedding = embedding[:self.dimension]
+        elif len(embedding) < self.dimension:
+            embedding = np.pad(embedding, (0, self.dimension - len(embedding)))
+        return embedding
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        """Normalize an embedding for cosine similarity"""
+        embedding = embedding / np.linalg.norm(embedding)
+        return embedding.astype('float32')
+
+    @staticmethod
+    def _cache_key(image_bytes: bytes) -> bytes:
+        return hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+    def _cache_get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._emb_cache_lock:
+            return self._emb_cache.get(key)
+
+    def _cache_put(self, key: bytes, embedding: np.ndarray):
+        with self._emb_cache_lock:
+            self._emb_cache[key] = embedding
+
+    async def _extract_face_embedding_async(self, image_bytes: bytes) -> Optional[np.ndarray]:
+        """
+        Extract face embedding off the event loop: preprocessing runs in the
+        threadpool and the FaceNet forward pass goes through the batcher so
+        concurrent requests share a single model call
+        """
+        key = self._cache_key(image_bytes)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        face_rgb = await run_in_threadpool(self._preprocess_face, image_bytes)
+        if face_rgb is None:
+            return None
+
+        try:
+            if self.batcher is not None:
+                embedding = await self.batcher.submit(face_rgb)
             else:
-                # Fallback: Use histogram-based features
-                logger.info("Using fallback embedding method (no FaceNet)")
-                # Convert to grayscale for histogram
-                gray_face = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY)
-                # Resize to consistent size
-                gray_face = cv2.resize(gray_face, (64, 64))
-                # Extract HOG features (Histogram of Oriented Gradients)
-                from skimage.feature import hog
-                embedding = hog(
-                    gray_face,
-                    orientations=9,
-                    pixels_per_cell=(8, 8),
-                    cells_per_block=(2, 2),
-                    visualize=False
-                )
-                # Ensure dimension matches
-                if len(embedding) > self.dimension:
-                    embedding = embedding[:self.dimension]
-                elif len(embedding) < self.dimension:
-                    embedding = np.pad(embedding, (0, self.dimension - len(embedding)))
-            
-            # Normalize embedding for cosine similarity
-            embedding = embedding / np.linalg.norm(embedding)
-            
-            return embedding.astype('float32')
-            
+                embedding = await run_in_threadpool(self._fallback_embedding, face_rgb)
+
+            embedding = self._normalize(embedding)
+            self._cache_put(key, embedding)
+            return embedding
+
         except Exception as e:
             logger.error(f"Error extracting face embedding: {e}")
             return None
-    
+
     async def enroll(self, user_id: str, image_bytes: bytes) -> dict:
         """Enroll a new face for a user (single image)"""
         try:
             logger.info(f"Enrolling face for user {user_id}")
-            embedding = self._extract_face_embedding(image_bytes)
+            embedding = await self._extract_face_embedding_async(image_bytes)
             
             if embedding is None:
                 return {
@@ -184,23 +601,9 @@ class FaceService:
                     "message": "No face detected in image"
                 }
             
-            # Add to FAISS index
-            embedding_reshaped = embedding.reshape(1, -1)
-            index_id = self.index.ntotal
-            self.index.add(embedding_reshaped)
-            
-            # Store label and embedding
-            self.labels[index_id] = user_id
-            
-            if user_id not in self.embeddings:
-                self.embeddings[user_id] = []
-            self.embeddings[user_id].append(embedding)
-            
-            # Save to disk
-            self._save_index()
-            self._save_labels()
-            self._save_embeddings()
-            
+            # Add to the index and append to the WAL
+            index_id = await self._commit_enroll(user_id, embedding)
+
             logger.info(f"Face enrolled successfully for user {user_id}, embedding_id: {index_id}")
             return {
                 "success": True,
@@ -225,7 +628,7 @@ class FaceService:
             # Extract embeddings from all images
             for idx, image_bytes in enumerate(image_bytes_list):
                 logger.info(f"Processing image {idx + 1}/{len(image_bytes_list)}")
-                embedding = self._extract_face_embedding(image_bytes)
+                embedding = await self._extract_face_embedding_async(image_bytes)
                 
                 if embedding is not None:
                     embeddings.append(embedding)
@@ -247,25 +650,10 @@ class FaceService:
             avg_embedding = avg_embedding / np.linalg.norm(avg_embedding)
             avg_embedding = avg_embedding.astype('float32')
             
-            # Add to FAISS index
-            embedding_reshaped = avg_embedding.reshape(1, -1)
-            index_id = self.index.ntotal
-            self.index.add(embedding_reshaped)
-            
-            # Store label and all individual embeddings
-            self.labels[index_id] = user_id
-            
-            if user_id not in self.embeddings:
-                self.embeddings[user_id] = []
-            # Store both individual embeddings and the averaged one
-            self.embeddings[user_id].extend(embeddings)
-            self.embeddings[user_id].append(avg_embedding)
-            
-            # Save to disk
-            self._save_index()
-            self._save_labels()
-            self._save_embeddings()
-            
+            # Add the averaged embedding (the one that is indexed and
+            # searched) to the index and append it to the WAL
+            index_id = await self._commit_enroll(user_id, avg_embedding)
+
             logger.info(f"Face enrolled successfully for user {user_id}, embedding_id: {index_id}, used {len(embeddings)} images")
             return {
                 "success": True,
@@ -283,10 +671,38 @@ class FaceService:
                 "message": f"Enrollment failed: {str(e)}"
             }
     
+    def _search_user(self, user_id: str, embedding: np.ndarray) -> float:
+        """
+        Top-k search plus per-user masking under the index lock, so the
+        writer can't mutate the index (or leave labels_arr behind the new
+        ids) mid-read. Runs in the threadpool: a search waiting out a
+        writer's quantization rebuild must not block the event loop.
+        """
+        with self._index_lock:
+            # Search in FAISS index (using Inner Product for cosine similarity)
+            embedding_reshaped = embedding.reshape(1, -1)
+            k = min(10, self.index.ntotal)  # Get top 10 matches
+            similarities, indices = self.index.search(embedding_reshaped, k)
+
+            if isinstance(self.index, faiss.IndexIVFPQ):
+                # Re-rank PQ candidates with exact similarities from the
+                # float32 store so quantization error can't flip the decision
+                ids = indices[0]
+                valid_ids = ids[ids != -1]
+                similarities = (self.store.vectors()[valid_ids] @ embedding).reshape(1, -1)
+                indices = valid_ids.reshape(1, -1)
+
+            # Mask the top-k results down to this user's rows in one shot;
+            # Inner Product gives cosine similarity for normalized vectors
+            ids = indices[0]
+            valid = ids != -1
+            user_sims = similarities[0][valid][self.labels_arr[ids[valid]] == user_id]
+            return float(user_sims.max()) if user_sims.size else 0.0
+
     async def verify(self, user_id: str, image_bytes: bytes) -> dict:
         """Verify a face against enrolled data"""
         try:
-            embedding = self._extract_face_embedding(image_bytes)
+            embedding = await self._extract_face_embedding_async(image_bytes)
             
             if embedding is None:
                 return {
@@ -304,25 +720,11 @@ class FaceService:
                     "message": "No enrolled faces in database"
                 }
             
-            # Search in FAISS index (using Inner Product for cosine similarity)
-            embedding_reshaped = embedding.reshape(1, -1)
-            k = min(10, self.index.ntotal)  # Get top 10 matches
-            similarities, indices = self.index.search(embedding_reshaped, k)
-            
-            # Check if any match belongs to the user
-            matched = False
-            best_confidence = 0.0
-            
-            for i, idx in enumerate(indices[0]):
-                if idx != -1 and self.labels.get(int(idx)) == user_id:
-                    # Inner Product gives cosine similarity for normalized vectors
-                    confidence = float(similarities[0][i])
-                    
-                    if confidence > self.threshold:
-                        matched = True
-                        best_confidence = max(best_confidence, confidence)
-                        break
-            
+            best_confidence = await run_in_threadpool(
+                self._search_user, user_id, embedding
+            )
+            matched = best_confidence > self.threshold
+
             logger.info(f"Face verification for {user_id}: match={matched}, confidence={best_confidence:.3f}")
             
             return {
@@ -1,3 +1,4 @@
+import asyncio
 import numpy as np
 import pickle
 import faiss
@@ -5,13 +6,21 @@ from pathlib import Path
 from typing import Optional
 import io
 import librosa
+import scipy.fft
 import soundfile as sf
+from starlette.concurrency import run_in_threadpool
 import logging
 import tempfile
 import os
+import warnings
 
 logger = logging.getLogger(__name__)
 
+# librosa warns (via audioread) about deprecated backends when decoding
+# browser WebM uploads; configure the filter once instead of mutating the
+# warnings registry on every extraction call
+warnings.filterwarnings('ignore', category=UserWarning, module='librosa')
+
 class VoiceService:
     def __init__(self):
         self.db_path = Path("data/voice")
@@ -19,18 +28,69 @@ class VoiceService:
         
         self.index_file = self.db_path / "faiss_index.bin"
         self.labels_file = self.db_path / "labels.pkl"
-        self.embeddings_file = self.db_path / "embeddings.pkl"
+        self.embeddings_file = self.db_path / "embeddings.npy"
+        self.embeddings_meta_file = self.db_path / "embeddings_meta.pkl"
+        self.legacy_embeddings_file = self.db_path / "embeddings.pkl"
         
         self.dimension = 80  # MFCC feature dimension (40 mean + 40 std)
         self.threshold = 0.70  # Similarity threshold
+        self.sq_train_size = 1000  # samples before scalar-quantizing the index
         self.sample_rate = 16000
         self.n_mfcc = 40
-        
+        self.n_fft = 2048
+        self.hop_length = 512
+        self.n_mels = 128
+
+        # DSP constants shared by every extraction call - computing the mel
+        # filterbank and DCT basis per request dominated MFCC cost
+        self._mel_fb = librosa.filters.mel(
+            sr=self.sample_rate, n_fft=self.n_fft, n_mels=self.n_mels
+        ).astype('float32')
+        self._dct = scipy.fft.dct(
+            np.eye(self.n_mels), type=2, norm='ortho', axis=0
+        )[:self.n_mfcc].astype('float32')
+        self._window = np.hanning(self.n_fft + 1)[:-1].astype('float32')
+
+        # Set by enroll; the autoflush loop persists dirty state in batches
+        self._dirty = False
+
+        # Optional fused torchaudio MFCC (on GPU when available), opted
+        # into with AUTHENTIX_USE_GPU=1; torch stays unimported otherwise
+        self._torch_mfcc = None
+        self._torch_device = None
+        if os.environ.get("AUTHENTIX_USE_GPU") == "1":
+            try:
+                import torch
+                import torchaudio
+                self._torch_device = "cuda" if torch.cuda.is_available() else "cpu"
+                self._torch_mfcc = torchaudio.transforms.MFCC(
+                    sample_rate=self.sample_rate,
+                    n_mfcc=self.n_mfcc,
+                    melkwargs={
+                        "n_fft": self.n_fft,
+                        "hop_length": self.hop_length,
+                        "n_mels": self.n_mels,
+                    },
+                ).to(self._torch_device)
+                logger.info(f"torchaudio MFCC enabled on {self._torch_device}")
+            except Exception as e:
+                logger.warning(
+                    f"AUTHENTIX_USE_GPU set but torchaudio is unavailable: {e}"
+                )
+
         # Initialize or load FAISS index
         self.index = self._load_or_create_index()
         self.labels = self._load_labels()
         self.embeddings = self._load_embeddings()
-        
+
+        # Per-user stacked embedding matrices so 1:1 verification is a
+        # single GEMV instead of a global index search
+        self.mats = {
+            user_id: np.stack(vectors).astype('float32')
+            for user_id, vectors in self.embeddings.items()
+            if vectors
+        }
+
     def _load_or_create_index(self) -> faiss.Index:
         """Load existing FAISS index or create new one"""
         if self.index_file.exists():
@@ -45,7 +105,35 @@ class VoiceService:
         index = faiss.IndexFlatIP(self.dimension)
         logger.info("Created new voice FAISS index")
         return index
-    
+
+    def _new_sq_index(self) -> faiss.Index:
+        """8-bit scalar-quantized flat index: 4x smaller, near-exact recall"""
+        return faiss.IndexScalarQuantizer(
+            self.dimension,
+            faiss.ScalarQuantizer.QT_8bit,
+            faiss.METRIC_INNER_PRODUCT
+        )
+
+    def _maybe_upgrade_index(self):
+        """
+        Swap the exact flat index for a scalar-quantized one once there is
+        enough data to train the quantizer. Ids are assigned sequentially,
+        so rebuilding from reconstructed vectors keeps the label mapping.
+        """
+        if not isinstance(self.index, faiss.IndexFlatIP):
+            return
+        if self.index.ntotal < self.sq_train_size:
+            return
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        upgraded = self._new_sq_index()
+        upgraded.train(vectors)
+        upgraded.add(vectors)
+        self.index = upgraded
+        logger.info(
+            f"Upgraded voice index to 8-bit scalar quantization "
+            f"({upgraded.ntotal} vectors)"
+        )
+
     def _load_labels(self) -> dict:
         """Load user ID labels"""
         if self.labels_file.exists():
@@ -54,25 +142,86 @@ class VoiceService:
         return {}
     
     def _load_embeddings(self) -> dict:
-        """Load stored voice embeddings"""
-        if self.embeddings_file.exists():
-            with open(self.embeddings_file, 'rb') as f:
+        """
+        Load stored voice embeddings. The current format is one contiguous
+        float32 matrix (embeddings.npy, memory-mapped) plus a per-user
+        (start, end) row-offset map; legacy pickle-of-dicts stores are
+        still read and converted on the next save.
+        """
+        if self.embeddings_file.exists() and self.embeddings_meta_file.exists():
+            matrix = np.load(self.embeddings_file, mmap_mode='r')
+            with open(self.embeddings_meta_file, 'rb') as f:
+                meta = pickle.load(f)
+            # Copy each row out of the mmap: _save_embeddings rewrites this
+            # file in place, and live views would silently start reading
+            # whatever rows land at the old offsets
+            return {
+                user_id: [np.array(matrix[i]) for i in range(start, end)]
+                for user_id, (start, end) in meta.items()
+            }
+        if self.legacy_embeddings_file.exists():
+            with open(self.legacy_embeddings_file, 'rb') as f:
                 return pickle.load(f)
         return {}
+
+    def _embeddings_snapshot(self):
+        """Contiguous float32 matrix + per-user row offsets of current state"""
+        meta = {}
+        rows = []
+        start = 0
+        for user_id, vectors in self.embeddings.items():
+            meta[user_id] = (start, start + len(vectors))
+            rows.extend(vectors)
+            start += len(vectors)
+        matrix = (np.stack(rows).astype('float32') if rows
+                  else np.empty((0, self.dimension), dtype='float32'))
+        return matrix, meta
     
-    def _save_embeddings(self):
-        """Save embeddings to disk"""
-        with open(self.embeddings_file, 'wb') as f:
-            pickle.dump(self.embeddings, f)
-    
-    def _save_index(self):
-        """Save FAISS index to disk"""
-        faiss.write_index(self.index, str(self.index_file))
-    
-    def _save_labels(self):
-        """Save labels to disk"""
+    def _write_snapshot(self, index_bytes: np.ndarray, labels: dict,
+                        matrix: np.ndarray, meta: dict):
+        """Blocking disk writes of an already-consistent snapshot; the
+        index goes through a temp file + os.replace so a crash mid-write
+        can't tear it"""
+        tmp = self.index_file.with_suffix('.bin.tmp')
+        index_bytes.tofile(str(tmp))
+        os.replace(tmp, self.index_file)
         with open(self.labels_file, 'wb') as f:
-            pickle.dump(self.labels, f)
+            pickle.dump(labels, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(self.embeddings_file, 'wb') as f:
+            np.save(f, matrix)
+        with open(self.embeddings_meta_file, 'wb') as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    async def flush(self):
+        """Persist state if anything changed since the last flush"""
+        if not self._dirty:
+            return
+        # Snapshot index/labels/embeddings here on the event loop, where
+        # enroll also mutates them, so a concurrent enroll can't change
+        # state mid-write; only the disk I/O leaves the loop
+        index_bytes = faiss.serialize_index(self.index)
+        labels = dict(self.labels)
+        matrix, meta = self._embeddings_snapshot()
+        await run_in_threadpool(
+            self._write_snapshot, index_bytes, labels, matrix, meta
+        )
+        # Cleared only after the write lands: a failed flush keeps the
+        # store dirty so the next cycle retries it
+        self._dirty = False
+
+    async def autoflush(self, interval: float = 5.0):
+        """Background loop persisting dirty state every `interval` seconds;
+        flushes one last time when cancelled at shutdown"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.flush()
+                except Exception as e:
+                    logger.error(f"Voice store flush failed (will retry): {e}")
+        except asyncio.CancelledError:
+            await self.flush()
+            raise
     
     def _extract_voice_features(self, audio_bytes: bytes) -> Optional[np.ndarray]:
         """
@@ -80,37 +229,54 @@ class VoiceService:
         Simple approach - use librosa's built-in format support
         """
         try:
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as tmp_file:
-                tmp_file.write(audio_bytes)
-                tmp_path = tmp_file.name
-            
             try:
-                # Load directly - librosa has some WebM support via audioread
-                import warnings
-                warnings.filterwarnings('ignore')
-                
-                audio_data, sr = librosa.load(tmp_path, sr=self.sample_rate)
-                
-            finally:
-                # Clean up temp file
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
-            
+                # libsndfile decodes straight from memory - no temp file,
+                # no filesystem round-trip
+                audio_data, sr = sf.read(io.BytesIO(audio_bytes), dtype='float32')
+                if audio_data.ndim > 1:
+                    audio_data = audio_data.mean(axis=1)
+                if sr != self.sample_rate:
+                    audio_data = librosa.resample(
+                        audio_data, orig_sr=sr, target_sr=self.sample_rate
+                    )
+            except Exception:
+                # Fall back to audioread via a temp file for containers
+                # libsndfile can't open (e.g. some WebM/Opus payloads)
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as tmp_file:
+                    tmp_file.write(audio_bytes)
+                    tmp_path = tmp_file.name
+
+                try:
+                    audio_data, sr = librosa.load(tmp_path, sr=self.sample_rate)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+
             # Check if audio is too short
             if len(audio_data) < self.sample_rate * 0.5:  # At least 0.5 seconds
                 logger.warning("Audio too short")
                 return None
             
-            # Extract MFCC features
-            mfcc = librosa.feature.mfcc(y=audio_data, sr=sr, n_mfcc=self.n_mfcc)
-            
-            # Compute statistics across time
-            mfcc_mean = np.mean(mfcc, axis=1)
-            mfcc_std = np.std(mfcc, axis=1)
-            
-            # Concatenate mean and std
-            features = np.concatenate([mfcc_mean, mfcc_std])
+            if self._torch_mfcc is not None:
+                mfcc = self._torch_mfcc_features(audio_data)
+            else:
+                # Manual MFCC pipeline over the cached window/filterbank/DCT;
+                # numerically matches librosa.feature.mfcc defaults
+                # (power spectrogram -> power_to_db with top_db=80 -> DCT-II)
+                padded = np.pad(audio_data, self.n_fft // 2, mode='constant')
+                frames = librosa.util.frame(
+                    padded, frame_length=self.n_fft, hop_length=self.hop_length
+                )
+                spectrum = scipy.fft.rfft(
+                    frames * self._window[:, None], axis=0, workers=-1
+                )
+                power = np.abs(spectrum) ** 2
+                mel = self._mel_fb @ power
+                log_mel = 10.0 * np.log10(np.maximum(mel, 1e-10))
+                log_mel = np.maximum(log_mel, log_mel.max() - 80.0)
+                mfcc = self._dct @ log_mel
+
+            features = self._mfcc_stats(mfcc)
             
             # Normalize for cosine similarity
             features = features / np.linalg.norm(features)
@@ -123,6 +289,30 @@ class VoiceService:
             logger.error(traceback.format_exc())
             return None
     
+    def _mfcc_stats(self, mfcc: np.ndarray) -> np.ndarray:
+        """
+        Per-coefficient mean and std over the frames in a single pass.
+        np.mean + np.std walked the matrix twice (std a third time for the
+        centered squares); the einsum gives the sum of squares without
+        materializing an mfcc**2 temporary.
+        """
+        n = mfcc.shape[1]
+        total = mfcc.sum(axis=1)
+        total_sq = np.einsum('ij,ij->i', mfcc, mfcc)
+        mean = total / n
+        variance = total_sq / n - mean * mean
+        std = np.sqrt(np.maximum(variance, 0.0))
+        return np.concatenate([mean, std])
+
+    def _torch_mfcc_features(self, audio_data: np.ndarray) -> np.ndarray:
+        """MFCC via the fused torchaudio transform, on GPU when present"""
+        import torch
+        with torch.no_grad():
+            waveform = torch.from_numpy(
+                np.ascontiguousarray(audio_data)
+            ).to(self._torch_device)
+            return self._torch_mfcc(waveform).cpu().numpy()
+
     def _cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
         """Calculate cosine similarity between two vectors"""
         return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
@@ -130,7 +320,8 @@ class VoiceService:
     async def enroll(self, user_id: str, audio_bytes: bytes) -> dict:
         """Enroll a new voice sample for a user"""
         try:
-            features = self._extract_voice_features(audio_bytes)
+            # MFCC extraction is sync CPU work - keep it off the event loop
+            features = await run_in_threadpool(self._extract_voice_features, audio_bytes)
             
             if features is None:
                 return {
@@ -142,19 +333,25 @@ class VoiceService:
             features_reshaped = features.reshape(1, -1)
             index_id = self.index.ntotal
             self.index.add(features_reshaped)
-            
+            self._maybe_upgrade_index()
+
             # Store label and embedding
             self.labels[index_id] = user_id
             
             if user_id not in self.embeddings:
                 self.embeddings[user_id] = []
             self.embeddings[user_id].append(features)
-            
-            # Save to disk
-            self._save_index()
-            self._save_labels()
-            self._save_embeddings()
-            
+
+            # Keep the per-user matrix in sync
+            if user_id in self.mats:
+                self.mats[user_id] = np.vstack([self.mats[user_id], features_reshaped])
+            else:
+                self.mats[user_id] = features_reshaped.copy()
+
+            # Writing index + labels + embeddings per enroll serialized the
+            # whole store each time; mark dirty and let autoflush batch it
+            self._dirty = True
+
             logger.info(f"Voice enrolled for user {user_id}")
             
             return {
@@ -172,7 +369,7 @@ class VoiceService:
     async def verify(self, user_id: str, audio_bytes: bytes) -> dict:
         """Verify voice against enrolled samples"""
         try:
-            features = self._extract_voice_features(audio_bytes)
+            features = await run_in_threadpool(self._extract_voice_features, audio_bytes)
             
             if features is None:
                 return {
@@ -182,32 +379,21 @@ class VoiceService:
                     "message": "Failed to extract voice features"
                 }
             
-            if self.index.ntotal == 0:
+            mat = self.mats.get(user_id)
+            if mat is None:
                 return {
                     "success": False,
                     "match": False,
                     "confidence": 0.0,
-                    "message": "No enrolled voice samples in database"
+                    "message": "No enrolled voice samples for this user"
                 }
-            
-            # Search in FAISS index
-            features_reshaped = features.reshape(1, -1)
-            k = min(10, self.index.ntotal)
-            similarities, indices = self.index.search(features_reshaped, k)
-            
-            # Check if any match belongs to the user
-            matched = False
-            best_confidence = 0.0
-            
-            for i, idx in enumerate(indices[0]):
-                if idx != -1 and self.labels.get(int(idx)) == user_id:
-                    confidence = float(similarities[0][i])
-                    
-                    if confidence > self.threshold:
-                        matched = True
-                        best_confidence = max(best_confidence, confidence)
-                        break
-            
+
+            # Embeddings are unit-normalized, so cosine similarity against
+            # every enrolled sample is one matrix-vector product
+            similarities = mat @ features
+            best_confidence = float(similarities.max())
+            matched = best_confidence > self.threshold
+
             logger.info(f"Voice verification for {user_id}: match={matched}, confidence={best_confidence:.3f}")
             
             return {
@@ -32,4 +32,10 @@ echo "API Documentation: http://localhost:8000/docs"
 echo "Health Check: http://localhost:8000/"
 echo ""
 
+# Runs uvicorn with uvloop/httptools, single worker by default.
+# Set AUTHENTIX_DEV=1 for auto-reload during development.
+# WEB_CONCURRENCY=N opts into multiple workers, but the enrollment stores
+# are per-process today, so leave it at 1 unless you know what you're doing.
+# gunicorn alternative (same caveat applies to -w):
+#   gunicorn main:app -k uvicorn.workers.UvicornWorker -w 1 --keep-alive 5
 python main.py